@@ -45,8 +45,9 @@ class Variable:
 
        The variable object offers two types of functionality to support
        search. 
-       (a) It has a current domain, implimented as a set of flags 
-           determining which domain values are "current", i.e., unpruned.
+       (a) It has a current domain, implimented as a bitmask of flags
+           (bit i for the i-th domain value) determining which domain
+           values are "current", i.e., unpruned.
            - you can prune a value, and restore it.
            - you can obtain a list of values in the current domain, or count
              how many are still there
@@ -81,7 +82,10 @@ class Variable:
         '''
         self.name = name                #text name for variable
         self.dom = list(domain)         #Make a copy of passed domain
-        self.curdom = [True] * len(domain)      #using list
+        self.dom_index = dict()         #value --> index in self.dom
+        for i, val in enumerate(self.dom):
+            self.dom_index.setdefault(val, i)
+        self.curdom = (1 << len(self.dom)) - 1  #bit i set iff dom[i] current
         #for bt_search
         self.assignedValue = None
 
@@ -89,8 +93,9 @@ class Variable:
         '''Add additional domain values to the domain
            Removals not supported removals'''
         for val in values: 
+            self.dom_index.setdefault(val, len(self.dom))
+            self.curdom |= 1 << len(self.dom)
             self.dom.append(val)
-            self.curdom.append(True)
 
     def domain_size(self):
         '''Return the size of the (permanent) domain'''
@@ -106,11 +111,11 @@ class Variable:
 
     def prune_value(self, value):
         '''Remove value from CURRENT domain'''
-        self.curdom[self.value_index(value)] = False
+        self.curdom &= ~(1 << self.value_index(value))
 
     def unprune_value(self, value):
         '''Restore value to CURRENT domain'''
-        self.curdom[self.value_index(value)] = True
+        self.curdom |= 1 << self.value_index(value)
 
     def cur_domain(self):
         '''return list of values in CURRENT domain (if assigned 
@@ -119,33 +124,43 @@ class Variable:
         if self.is_assigned():
             vals.append(self.get_assigned_value())
         else:
-            for i, val in enumerate(self.dom):
-                if self.curdom[i]:
-                    vals.append(val)
+            mask = self.curdom
+            while mask:
+                bit = mask & -mask  #lowest current value
+                vals.append(self.dom[bit.bit_length() - 1])
+                mask ^= bit
         return vals
 
+    def cur_domain_mask(self):
+        '''return the CURRENT domain as a bitmask over domain indices (bit i
+           set iff the i-th domain value is current; if assigned only the
+           bit of the assigned value is set)'''
+        if self.is_assigned():
+            return 1 << self.value_index(self.get_assigned_value())
+        return self.curdom
+
     def in_cur_domain(self, value):
         '''check if value is in CURRENT domain (without constructing list)
            if assigned only assigned value is viewed as being in current 
            domain'''
-        if not value in self.dom:
+        i = self.dom_index.get(value)
+        if i is None:
             return False
         if self.is_assigned():
             return value == self.get_assigned_value()
         else:
-            return self.curdom[self.value_index(value)]
+            return self.curdom >> i & 1 == 1
 
     def cur_domain_size(self):
         '''Return the size of the variables domain (without construcing list)'''
         if self.is_assigned():
             return 1
         else:
-            return(sum(1 for v in self.curdom if v))
+            return(bin(self.curdom).count('1'))
 
     def restore_curdom(self):
         '''return all values back into CURRENT domain'''
-        for i in range(len(self.curdom)):
-            self.curdom[i] = True
+        self.curdom = (1 << len(self.dom)) - 1
 
     #
     #methods for assigning and unassigning
@@ -184,7 +199,7 @@ class Variable:
     def value_index(self, value):
         '''Domain values need not be numbers, so return the index
            in the domain list of a variable value'''
-        return self.dom.index(value)
+        return self.dom_index[value]
 
     def __repr__(self):
         return("Var-{}".format(self.name))
@@ -196,7 +211,8 @@ class Variable:
         '''Also print the variable domain and current domain'''
         print("Var--\"{}\": Dom = {}, CurDom = {}".format(self.name, 
                                                              self.dom, 
-                                                             self.curdom))
+                                                             [self.curdom >> i & 1 == 1
+                                                              for i in range(len(self.dom))]))
 class Constraint: 
     '''Class for defining constraints variable objects specifes an
        ordering over variables.  This ordering is used when calling
@@ -216,12 +232,13 @@ class Constraint:
 
         NOTE: This is a very space expensive representation...a proper
         constraint object would allow for representing the constraint
-        with a function.  
+        with a function.  set_predicate does that: a constraint given a
+        predicate needs no satisfying tuples at all.
         '''
 
         self.scope = list(scope)
         self.name = name
-        self.sat_tuples = dict()
+        self.sat_tuples = set()
 
         #The next object data item 'sup_tuples' will be used to help
         #support GAC propgation. It allows access to a list of 
@@ -229,19 +246,45 @@ class Constraint:
         #pair.
         self.sup_tuples = dict()
 
+        #Optional function representation, see set_predicate and
+        #set_support_function
+        self.predicate = None
+        self.partial_predicate = None
+        self.support_fn = None
+
+    def set_support_function(self, fn):
+        '''Specify a function fn(constraint, var, val) that has_support
+           uses instead of scanning the supporting tuples. It must return
+           the same answer the tuple table would.'''
+        self.support_fn = fn
+
+    def set_predicate(self, fn, partial_fn=None):
+        '''Specify the constraint by a function fn(vals) returning true iff
+           the list of values (ordered as the scope) satisfies it, instead
+           of by a list of satisfying tuples. check then calls fn, and
+           has_support (unless given a support function) searches the
+           current domains of the other variables for values satisfying fn.
+
+           partial_fn(vals), if given, is called on the values chosen so
+           far during that search (in no particular order) and must return
+           false only if no completion of them can satisfy the constraint;
+           it lets the search abandon such partial assignments early.'''
+        self.predicate = fn
+        self.partial_predicate = partial_fn
+
     def add_satisfying_tuples(self, tuples):
         '''We specify the constraint by adding its complete list of satisfying tuples.'''
+        #tuples that are already tuples are stored as is (not copied), so
+        #a list of tuples shared by several constraints is only held once
         for x in tuples:
             t = tuple(x)  #ensure we have an immutable tuple
-            if not t in self.sat_tuples:
-                self.sat_tuples[t] = True
+            if t in self.sat_tuples:
+                continue
+            self.sat_tuples.add(t)
 
             #now put t in as a support for all of the variable values in it
-            for i, val in enumerate(t):
-                var = self.scope[i]
-                if not (var,val) in self.sup_tuples:
-                    self.sup_tuples[(var,val)] = []
-                self.sup_tuples[(var,val)].append(t)
+            for var, val in zip(self.scope, t):
+                self.sup_tuples.setdefault((var, val), []).append(t)
 
     def get_scope(self):
         '''get list of variables the constraint is over'''
@@ -254,6 +297,8 @@ class Constraint:
            constraints "satisfies" function.  Note the list of values
            are must be ordered in the same order as the list of
            variables in the constraints scope'''
+        if self.predicate is not None:
+            return self.predicate(vals)
         return tuple(vals) in self.sat_tuples
 
     def get_n_unasgn(self):
@@ -278,12 +323,47 @@ class Constraint:
            of assignments satisfying the constraint where each value is
            still in the corresponding variables current domain
         '''
+        if self.support_fn is not None:
+            return self.support_fn(self, var, val)
+        if self.predicate is not None:
+            return self.predicate_has_support(var, val)
         if (var, val) in self.sup_tuples:
             for t in self.sup_tuples[(var, val)]:
                 if self.tuple_is_valid(t):
                     return True
         return False
 
+    def predicate_has_support(self, var, val):
+        '''Internal routine. has_support for a constraint specified by a
+           predicate: search for current domain values of the other
+           variables that together with var = val satisfy the predicate.
+           Variables with the smallest current domains are tried first.'''
+        vals = [None] * len(self.scope)
+        positions = []
+        for i, v in enumerate(self.scope):
+            if v is var:
+                vals[i] = val
+            else:
+                positions.append(i)
+        positions.sort(key=lambda i: self.scope[i].cur_domain_size())
+        domains = [self.scope[i].cur_domain() for i in positions]
+        return self.extend_support(vals, positions, domains, 0, [val])
+
+    def extend_support(self, vals, positions, domains, k, chosen):
+        '''Internal routine. Try every value for the k-th variable of the
+           predicate_has_support search, recursing on the rest'''
+        if k == len(positions):
+            return self.predicate(vals)
+        i = positions[k]
+        for w in domains[k]:
+            vals[i] = w
+            chosen.append(w)
+            if self.partial_predicate is None or self.partial_predicate(chosen):
+                if self.extend_support(vals, positions, domains, k + 1, chosen):
+                    return True
+            chosen.pop()
+        return False
+
     def tuple_is_valid(self, t):
         '''Internal routine. Check if every value in tuple is still in
            corresponding variable domains'''
@@ -341,8 +421,11 @@ class CSP:
         return self.cons
         
     def get_cons_with_var(self, var):
-        '''return list of constraints that include var in their scope'''
-        return list(self.vars_to_cons[var])
+        '''return list of constraints that include var in their scope.
+           This is the index maintained by add_constraint (not a copy, so
+           callers must not modify it), as propagators call this on every
+           assignment and prune'''
+        return self.vars_to_cons[var]
 
     def get_all_vars(self):
         '''return list of variables in the CSP'''
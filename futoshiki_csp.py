@@ -7,36 +7,224 @@ Construct and return Futoshiki CSP models.
 
 from cspbase import *
 import itertools
+import math
+import operator
+
+# infix operator used by the generated check of each binary constraint name
+_CHECK_OPERATORS = {
+    '>': '>',
+    '<': '<',
+    'not_equal': '!='
+}
+
+
+def _lt_support(constraint, var, val):
+    '''Closed form support test for a '<' constraint over [a, b]'''
+    a, b = constraint.scope
+    if var is a:
+        return any(val < w for w in b.cur_domain())
+    return any(w < val for w in a.cur_domain())
+
+
+def _gt_support(constraint, var, val):
+    '''Closed form support test for a '>' constraint over [a, b]'''
+    a, b = constraint.scope
+    if var is a:
+        return any(val > w for w in b.cur_domain())
+    return any(w > val for w in a.cur_domain())
+
+
+def _ne_support(constraint, var, val):
+    '''Closed form support test for a not_equal constraint over [a, b]'''
+    a, b = constraint.scope
+    other = b if var is a else a
+    size = other.cur_domain_size()
+    return size > 1 or (size == 1 and not other.in_cur_domain(val))
+
+
+# has_support replacements for the binary constraint names
+_SUPPORT_FUNCTIONS = {
+    '>': _gt_support,
+    '<': _lt_support,
+    'not_equal': _ne_support
+}
+
+# satisfying tuples keyed by (constraint name, domains of the scope)
+_tuple_cache = {}
+
+# generated check functions keyed by (constraint name, arity)
+_check_cache = {}
+
+# all_different constraints that may have more satisfying tuples than this
+# (5!, a row or column with five free cells) get a predicate instead of a table;
+# past that point building the table costs more than the searches it saves
+_MAX_TABLE_SIZE = 120
 
 
 def all_different_check(t):
-    size = len(t)
-    for i in range(size):
-        j = i + 1
-        while j < size:
-            if t[i] == t[j]:
-                return False
-            j += 1
+    # board values are 1..n (n <= 9), so each value owns one bit of the mask
+    mask = 0
+    for v in t:
+        bit = 1 << v
+        if mask & bit:
+            return False
+        mask |= bit
     return True
 
 
+def compile_check(name, arity):
+    '''Return a check(vals) function specialised to a constraint name and
+    arity. The source is generated with the values unpacked into locals
+    (and, for all_different, the bitmask test unrolled) and compiled once
+    per shape. Like a table lookup it rejects a vals list of the wrong
+    length; the values themselves are taken to be from the scope domains.'''
+    key = (name, arity)
+    if key not in _check_cache:
+        names = ['a{}'.format(i) for i in range(arity)]
+        lines = ['def check(vals):',
+                 '    if len(vals) != {}:'.format(arity),
+                 '        return False',
+                 '    {}, = vals'.format(', '.join(names))]
+        if name == 'all_different':
+            lines.append('    m = 1 << a0')
+            for a in names[1:]:
+                lines += ['    b = 1 << {}'.format(a),
+                          '    if m & b:',
+                          '        return False',
+                          '    m |= b']
+            lines.append('    return True')
+        else:
+            lines.append('    return a0 {} a1'.format(_CHECK_OPERATORS[name]))
+        namespace = {}
+        code = compile('\n'.join(lines) + '\n',
+                       '<check {} {}>'.format(name, arity), 'exec')
+        exec(code, namespace)
+        _check_cache[key] = namespace['check']
+    return _check_cache[key]
+
+
+def gen_alldiff(domains):
+    '''Return every tuple of pairwise different values drawn from domains.
+    Domains are held as bitmasks so the values still available at each
+    position are found with integer operations, and the last position is
+    filled without recursing'''
+    if all(d == domains[0] for d in domains):
+        # every cell shares one domain: the valid tuples are exactly its
+        # permutations, which itertools enumerates without any filtering
+        return list(itertools.permutations(domains[0], len(domains)))
+    out = []
+    last = len(domains) - 1
+    masks = [sum(1 << v for v in d) for d in domains]
+
+    def extend(k, prefix, used_mask):
+        free = masks[k] & ~used_mask
+        while free:
+            bit = free & -free  # lowest remaining value
+            free ^= bit
+            if k == last:
+                out.append(prefix + (bit.bit_length() - 1,))
+            else:
+                extend(k + 1, prefix + (bit.bit_length() - 1,), used_mask | bit)
+
+    extend(0, (), 0)
+    return out
+
+
+def alldiff_tuples(domains):
+    '''Return the satisfying tuples of an all_different constraint whose
+    scope has the given domains. Pre-set cells (singleton domains) are
+    taken out first: their values are removed from the other domains, the
+    remaining cells are enumerated on their own, and the pre-set values
+    are put back into place.'''
+    fixed_pos = [i for i, d in enumerate(domains) if len(d) == 1]
+    if not fixed_pos:
+        return gen_alldiff(domains)
+    fixed_vals = [domains[i][0] for i in fixed_pos]
+    if len(set(fixed_vals)) < len(fixed_vals):
+        return []  # two pre-set cells already clash
+    free_pos = [i for i, d in enumerate(domains) if len(d) != 1]
+    if not free_pos:
+        return [tuple(fixed_vals)]
+    free_domains = [[v for v in domains[i] if v not in fixed_vals]
+                    for i in free_pos]
+    # each free tuple plus the pre-set values is reordered into scope order
+    order = [0] * len(domains)
+    for k, i in enumerate(free_pos + fixed_pos):
+        order[i] = k
+    reorder = operator.itemgetter(*order)
+    fixed_tup = tuple(fixed_vals)
+    return [reorder(t + fixed_tup) for t in gen_alldiff(free_domains)]
+
+
+def alldiff_table_bound(domains):
+    '''Return an upper bound on the number of satisfying tuples of an
+    all_different constraint over the given domains: the free cells can
+    only take the values no pre-set cell holds, each value at most once'''
+    fixed = set(d[0] for d in domains if len(d) == 1)
+    free = [d for d in domains if len(d) != 1]
+    values = set().union(*free) - fixed
+    return math.perm(len(values), len(free))
+
+
 def check_constraint_add_tuples(constraint):
+    scope = constraint.get_scope()
+    if constraint.name in _SUPPORT_FUNCTIONS:
+        # binary constraints are checked and supported in closed form, so
+        # they need no table of satisfying tuples
+        constraint.set_predicate(compile_check(constraint.name, len(scope)))
+        constraint.set_support_function(_SUPPORT_FUNCTIONS[constraint.name])
+        return
     domains = []
-    for var in constraint.get_scope():
+    for var in scope:
         domains.append(var.domain())
-    sat_tup = []
-    switch = {
-        '>': lambda t: t[0] > t[1],
-        '<': lambda t: t[0] < t[1],
-        'not_equal': lambda t: not t[0] == t[1],
-        'all_different': all_different_check
-    }
-    for t in itertools.product(*domains):
-        if switch.get(constraint.name)(t):
-            sat_tup.append(t)
+    if alldiff_table_bound(domains) > _MAX_TABLE_SIZE:
+        # too many tuples to store: check on the fly, and let the support
+        # search drop any partial assignment that already repeats a value
+        constraint.set_predicate(compile_check(constraint.name, len(scope)),
+                                 all_different_check)
+        return
+    # constraints with the same name over the same domains share one table
+    key = (constraint.name, tuple(tuple(d) for d in domains))
+    sat_tup = _tuple_cache.get(key)
+    if sat_tup is None:
+        # only enumerate the permutations compatible with the cell domains
+        sat_tup = alldiff_tuples(domains)
+        _tuple_cache[key] = sat_tup
     constraint.add_satisfying_tuples(sat_tup)
 
 
+def build_variables(initial_futoshiki_board):
+    '''Return variable_array together with the flat list of its variables.
+    Cell i,j gets domain [1,...,n] if the board has a 0 there and [item] if
+    it holds the pre-set number item. The cells of a board row sit at the
+    even indices, between them are the inequality symbols.'''
+    # Variable copies the domain it is given, so one list serves every cell
+    full_domain = [i + 1 for i in range(len(initial_futoshiki_board))]
+    variable_array = []
+    csp_variables = []
+    for i, row in enumerate(initial_futoshiki_board):
+        var_row = []
+        for j, item in enumerate(row[::2]):
+            var = Variable(f'V{i},{j}', full_domain if item == 0 else [item])
+            var_row.append(var)
+            csp_variables.append(var)
+        variable_array.append(var_row)
+    return variable_array, csp_variables
+
+
+def add_not_equal(csp, x, y):
+    '''Add a binary not_equal constraint over x and y to csp. Two pre-set
+    cells holding different values can never violate it, so no constraint
+    is added for them (equal pre-set values are kept so the CSP stays
+    unsatisfiable).'''
+    dx, dy = x.domain(), y.domain()
+    if len(dx) == 1 and len(dy) == 1 and dx[0] != dy[0]:
+        return
+    c = Constraint('not_equal', [x, y])
+    check_constraint_add_tuples(c)
+    csp.add_constraint(c)
+
+
 def futoshiki_csp_model_1(initial_futoshiki_board):
     '''Return a CSP object representing a Futoshiki CSP problem along with an
     array of variables for the problem. That is return
@@ -107,25 +295,7 @@ def futoshiki_csp_model_1(initial_futoshiki_board):
     constraints whose scope includes two and only two variables).
     '''
 
-    variable_array = [[] for i in range(len(initial_futoshiki_board))]
-    csp_variables = []
-    full_domain = [i + 1 for i in range(len(initial_futoshiki_board))]
-    for i, row in enumerate(initial_futoshiki_board):
-        number = True
-        j = 0
-        for item in row:
-            if number:
-                if item == 0:
-                    domain = list(full_domain)
-                else:
-                    domain = [item]
-                var = Variable('V{},{}'.format(i, j), domain)
-                variable_array[i].append(var)
-                csp_variables.append(var)
-                number = False
-                j += 1
-            else:
-                number = True
+    variable_array, csp_variables = build_variables(initial_futoshiki_board)
     csp = CSP('Futoshiki-M1', csp_variables)
 
     # add constraints for row and column
@@ -135,16 +305,12 @@ def futoshiki_csp_model_1(initial_futoshiki_board):
         for cur_item in range(size):
             j = cur_item + 1
             while j < size:
-                c = Constraint('not_equal', [variable_array[i][cur_item], variable_array[i][j]])
-                check_constraint_add_tuples(c)
-                csp.add_constraint(c)
+                add_not_equal(csp, variable_array[i][cur_item], variable_array[i][j])
                 j += 1
             # for column
             k = i + 1
             while k < size:
-                c = Constraint('not_equal', [variable_array[i][cur_item], variable_array[k][cur_item]])
-                check_constraint_add_tuples(c)
-                csp.add_constraint(c)
+                add_not_equal(csp, variable_array[i][cur_item], variable_array[k][cur_item])
                 k += 1
 
     # create constraints for the board
@@ -204,25 +370,7 @@ def futoshiki_csp_model_2(initial_futoshiki_board):
     required by the board. There should be j of these constraints, where j is
     the number of inequality symbols found on the board.  
     '''
-    variable_array = [[] for i in range(len(initial_futoshiki_board))]
-    csp_variables = []
-    full_domain = [i + 1 for i in range(len(initial_futoshiki_board))]
-    for i, row in enumerate(initial_futoshiki_board):
-        number = True
-        j = 0
-        for item in row:
-            if number:
-                if item == 0:
-                    domain = list(full_domain)
-                else:
-                    domain = [item]
-                var = Variable('V{},{}'.format(i, j), domain)
-                variable_array[i].append(var)
-                csp_variables.append(var)
-                number = False
-                j += 1
-            else:
-                number = True
+    variable_array, csp_variables = build_variables(initial_futoshiki_board)
     csp = CSP('Futoshiki-M2', csp_variables)
 
     # add all different constraints for row and column
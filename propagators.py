@@ -58,6 +58,8 @@ propagator == a function with the following template
             V.
 '''
 
+from collections import deque
+
 
 def prop_BT(csp, newVar=None):
     '''Do plain backtracking propagation. That is, do no
@@ -113,32 +115,36 @@ def prop_FC(csp, newVar=None):
         # the new var is None
         # check the constraints that has only one variable
         constraints = csp.get_all_cons()
-    unassignedIndex = 0
     for constraint in constraints:
         if constraint.get_n_unasgn() == 1:
             vars = constraint.get_scope()
-            vals = []
-            for i, var in enumerate(vars):
-                if not var.is_assigned():
-                    unassignedVar = var
-                    unassignedIndex = i
-                    vals.append(0)
-                else:
-                    vals.append(var.get_assigned_value())
+            vals = [var.get_assigned_value() for var in vars]
+            # get_assigned_value() is None only for the unassigned variable
+            unassignedIndex = vals.index(None)
+            unassignedVar = vars[unassignedIndex]
             # test the constraint with string the value in the domain of the only unassigned variable
             cur_dom = unassignedVar.cur_domain()
+            remaining = len(cur_dom)
             for val in cur_dom:
                 vals[unassignedIndex] = val
                 if not constraint.check(vals):
                     unassignedVar.prune_value(val)
                     pruned.append((unassignedVar, val))
-            if len(unassignedVar.cur_domain()) == 0:
+                    remaining -= 1
+            if remaining == 0:
                 # Domain wiped out
                 return False, pruned
 
     return True, pruned
 
 
+def _gac_tightness(constraint):
+    '''Sort key ordering constraints for the initial GAC queue'''
+    scope = constraint.get_scope()
+    return (constraint.name not in ('<', '>'), len(scope),
+            sum(v.cur_domain_size() for v in scope))
+
+
 def prop_GAC(csp, newVar=None):
     '''Do GAC propagation, as described in lecture. See beginning of this file
     for complete description of what propagator functions should take as input
@@ -198,18 +204,32 @@ def prop_GAC(csp, newVar=None):
         # for gac we establish initial GAC by initializing the GAC queue with
         # all constaints of the csp
         constraints = csp.get_all_cons()
-    gac_queue = [(var, constraint) for constraint in constraints \
-                 for var in constraint.get_scope()]
+    gac_queue = deque()
+    in_queue = set()  # mirrors gac_queue for O(1) membership tests
+    # revise the tightest constraints first (inequalities, then the smallest
+    # scopes and domains) so later revisions see already reduced domains
+    constraints = sorted(constraints, key=_gac_tightness)
+    for constraint in constraints:
+        for var in constraint.get_scope():
+            if (var, constraint) not in in_queue:
+                in_queue.add((var, constraint))
+                gac_queue.append((var, constraint))
 
     while gac_queue:
         is_shrinked_domain = False
-        var, constraint = gac_queue.pop(0)  # get the first gac constraint
-        for val in var.cur_domain():
+        var, constraint = gac_queue.popleft()  # get the first gac constraint
+        in_queue.discard((var, constraint))
+        # cur_domain() builds a new list, so take it once and count down
+        # (an assigned variable only has its assigned value in it)
+        dom_snapshot = var.cur_domain()
+        remaining = len(dom_snapshot)
+        for val in dom_snapshot:
             if not constraint.has_support(var, val):
                 var.prune_value(val)
                 pruned.append((var, val))
                 #print("pruned, ", val)
-                if len(var.cur_domain()) == 0:
+                remaining -= 1
+                if remaining == 0:
                     # Domain wiped out
                     return False, pruned
                 else:
@@ -220,10 +240,17 @@ def prop_GAC(csp, newVar=None):
             i = 0
 
             for c in csp.get_cons_with_var(var):
+                # AC-3: the pruned values had no support in constraint, so
+                # they supported nothing there; once all other variables of
+                # c are assigned there is nothing left to prune in c either
+                if c is constraint or c.get_n_unasgn() <= 1:
+                    continue
                 for v in c.get_scope():
-                    if not v == var:
-                        if (v,c) not in gac_queue:
-                            gac_queue.append((v,c))
+                    # an assigned variable keeps its value whatever is pruned
+                    if not v == var and not v.is_assigned():
+                        if (v, c) not in in_queue:
+                            in_queue.add((v, c))
+                            gac_queue.append((v, c))
             '''
             for checked_var, checked_constraint in checked_gac_queue:
                 if var in checked_constraint.get_scope() and not checked_var == var: